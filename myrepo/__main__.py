@@ -1,8 +1,11 @@
-import importlib
+import os
 import sys
-import pathlib
 
-if pathlib.Path('./myrepo/__init__.py').absolute().exists():
+# Running from a source checkout is opt-in through MYREPO_DEV,
+# so that regular installs don't pay for the lookup and importlib.util.
+if os.environ.get('MYREPO_DEV') and os.path.isfile('./myrepo/__init__.py'):
+	import importlib.util
+
 	spec = importlib.util.spec_from_file_location("myrepo", "./myrepo/__init__.py")
 	myrepo = importlib.util.module_from_spec(spec)
 	sys.modules["myrepo"] = myrepo
@@ -1,18 +1,36 @@
+import concurrent.futures
 import pathlib
 from .storage import storage
 from ..system.workers import SysCommand
 from ..exceptions import RepositoryError, SysCallError
 
+def _init_repo(repo_name :str, path :pathlib.Path, arch :str) -> bool:
+	database_path = path/repo_name/"os"/arch/f"{repo_name}.db.tar.gz"
+	# package_path = path/repo_name/"os"/arch/f"{{*.pkg.tar.xz,*.pkg.tar.zst}}"
+	package_path = path/repo_name/"os"/arch/f"__init__"
+
+	(path/repo_name/"os"/arch).mkdir(parents=True, exist_ok=True)
+
+	try:
+		SysCommand(f"repo-add {database_path} {package_path}")
+	except SysCallError as error:
+		if error.exit_code not in (0, 1):
+			raise RepositoryError(f"Could not initiate repository {database_path}: [{error.exit_code}] {error}")
+
+	return True
+
 def setup_destination(path :pathlib.Path) -> bool:
-	for repo in storage['repositories']:
-		database_path = path/repo[0]/"os"/storage['arguments'].architecture/f"{repo[0]}.db.tar.gz"
-		# package_path = path/repo[0]/"os"/storage['arguments'].architecture/f"{{*.pkg.tar.xz,*.pkg.tar.zst}}"
-		package_path = path/repo[0]/"os"/storage['arguments'].architecture/f"__init__"
-
-		(path/repo[0]/"os"/storage['arguments'].architecture).mkdir(parents=True, exist_ok=True)
-
-		try:
-			SysCommand(f"repo-add {database_path} {package_path}")
-		except SysCallError as error:
-			if error.exit_code not in (0, 256):
-				raise RepositoryError(f"Could not initiate repository {database_path}: [{error.exit_code}] {error}")
\ No newline at end of file
+	if not (repositories := storage['repositories'].enabled()):
+		return True
+
+	# Each repository initiation is dominated by the repo-add subprocess,
+	# so we can run them side by side in threads.
+	with concurrent.futures.ThreadPoolExecutor(max_workers=len(repositories)) as executor:
+		tasks = [executor.submit(_init_repo, repo_name, path, storage['arguments'].architecture) for repo_name in repositories]
+		concurrent.futures.wait(tasks)
+
+	for task in tasks:
+		# Re-raises any RepositoryError from the worker threads
+		task.result()
+
+	return True
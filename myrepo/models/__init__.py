@@ -1,12 +1,24 @@
-from typing import Optional, List
+from dataclasses import dataclass, fields
+from typing import Optional, List, Iterator, Tuple
 from pydantic import BaseModel
 
-class RepositoryStruct(BaseModel):
+@dataclass
+class RepositoryStruct:
 	core :bool = True
 	extra :bool = True
 	community :bool = True
 	testing :bool = False
 
+	def __iter__(self) -> Iterator[Tuple[str, bool]]:
+		for field in fields(self):
+			yield field.name, getattr(self, field.name)
+
+	def enabled(self) -> Tuple[str, ...]:
+		"""
+		Returns the names of all repositories that are enabled.
+		"""
+		return tuple(name for name, enabled in self if enabled)
+
 class PackageSearchResult(BaseModel):
 	pkgname: str
 	pkgbase: str
@@ -35,6 +47,15 @@ class PackageSearchResult(BaseModel):
 	makedepends: List[str]
 	checkdepends: List[str]
 
+	@property
+	def version(self) -> str:
+		"""
+		The full ``[epoch:]pkgver-pkgrel`` version, as pacman compares it.
+		"""
+		if self.epoch:
+			return f"{self.epoch}:{self.pkgver}-{self.pkgrel}"
+		return f"{self.pkgver}-{self.pkgrel}"
+
 class PackageSearch(BaseModel):
 	version: int
 	limit: int
@@ -1,6 +1,9 @@
 import json
 from typing import Any
 
+# Types json.dumps() already knows how to serialize as-is
+_JSON_SCALARS = frozenset((str, int, float, bool))
+
 class JsonEncoder:
 	@staticmethod
 	def _encode(obj :Any) -> Any:
@@ -10,17 +13,16 @@ class JsonEncoder:
 		something that's understandable by the json.parse()/json.loads() lib.
 		_encode() will skip any dictionary key starting with an exclamation mark (!)
 		"""
+		if obj is None or type(obj) in _JSON_SCALARS:
+			return obj
+
 		if isinstance(obj, dict) and not hasattr(obj, 'json'):
 			# We'll need to iterate not just the value that default() usually gets passed
 			# But also iterate manually over each key: value pair in order to trap the keys.
 
 			copy = {}
 			for key, val in list(obj.items()):
-				if isinstance(val, dict):
-					# This, is a EXTREMELY ugly hack.. but it's the only quick way I can think of to trigger a encoding of sub-dictionaries.
-					val = json.loads(json.dumps(val, cls=JSON))
-				else:
-					val = JsonEncoder._encode(val)
+				val = JsonEncoder._encode(val)
 
 				if type(key) == str and key[0] == '!':
 					pass
@@ -35,7 +37,7 @@ class JsonEncoder:
 			except TypeError:
 				raise TypeError(f"Could not convert JSON data returned by {obj} back into a Python JSON serializable structure.")
 		elif isinstance(obj, (list, set, tuple)):
-			return [json.loads(json.dumps(item, cls=JSON)) for item in obj]
+			return [JsonEncoder._encode(item) for item in obj]
 		else:
 			return obj
 
@@ -1,4 +1,6 @@
+import ast
 import io
+import json
 
 # Imports for supported libraries exposed by pyson.load() and pyson.loads()
 import time
@@ -7,6 +9,21 @@ import pathlib
 orig_globals = globals
 orig_locals = locals
 
+def _parse_value(token, namespace=None):
+	# Most keys and values are plain literals, which json.loads() and
+	# ast.literal_eval() handle without compiling any code.
+	# Only actual expressions, such as pathlib.Path(...), fall through to eval(),
+	# which sees the module globals and the names the caller passed to load().
+	try:
+		return json.loads(token)
+	except ValueError:
+		pass
+
+	try:
+		return ast.literal_eval(token)
+	except (ValueError, SyntaxError):
+		return eval(token, orig_globals(), namespace)
+
 def load(file, globals=None, locals=None, *args, **kwargs):
 	if globals:
 		orig_globals().update(globals)
@@ -28,13 +45,13 @@ def load(file, globals=None, locals=None, *args, **kwargs):
 			key, val = line.split(':', 1)
 			key, val = key.strip(' ,;\r\n'), val.strip(' ,;\r\n')
 
-			key = eval(key)
+			key = _parse_value(key, locals)
 			if val == '{':
 				pointer[key] = {}
 				last_level.append(pointer) # Not efficient
 				pointer = pointer[key]
 			else:
-				val = eval(val)
+				val = _parse_value(val, locals)
 				pointer[key] = val
 
 		elif line.strip(' ,;\r\n') in ('}', '},'):
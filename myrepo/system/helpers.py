@@ -1,37 +1,45 @@
 import hashlib
 import os
-import subprocess
 import re
+from functools import lru_cache
 from typing import Union
 from ..exceptions import RequirementError
 
+# CSI sequences (colors, cursor movement) and OSC sequences (window titles etc),
+# the latter terminated by either BEL or ESC \
+_VT100_ESCAPE_STR = re.compile(r'\x1B\[[?0-9;]*[a-zA-Z]|\x1B\][\x20-\x7E]*?(?:\x07|\x1B\\)')
+_VT100_ESCAPE_BYTES = re.compile(rb'\x1B\[[?0-9;]*[a-zA-Z]|\x1B\][\x20-\x7E]*?(?:\x07|\x1B\\)')
+
+@lru_cache(maxsize=None)
 def locate_binary(name :str) -> str:
 	for PATH in os.environ['PATH'].split(':'):
-		for root, folders, files in os.walk(PATH):
-			for file in files:
-				if file == name:
-					return os.path.join(root, file)
-			break # Don't recurse
+		# A single stat() per PATH entry, instead of listing every file in it
+		if os.path.isfile(candidate := os.path.join(PATH, name)) and os.access(candidate, os.X_OK):
+			return candidate
 
 	raise RequirementError(f"Binary {name} does not exist.")
 
 def gen_uid(entropy_length :int = 256) -> str:
-	return hashlib.sha512(os.urandom(entropy_length)).hexdigest()
+	# The input is already CSPRNG output, the hash only gives us a fixed width
+	# (128 hex characters, same as SHA-512) and BLAKE2b gets there faster.
+	return hashlib.blake2b(os.urandom(entropy_length)).hexdigest()
 
 def pid_exists(pid: int) -> bool:
+	# Signal 0 only performs the existence and permission checks,
+	# which spares us from spawning `ps` for every check.
 	try:
-		return any(subprocess.check_output(['/usr/bin/ps', '--no-headers', '-o', 'pid', '-p', str(pid)]).strip())
-	except subprocess.CalledProcessError:
+		os.kill(pid, 0)
+	except ProcessLookupError:
 		return False
+	except PermissionError:
+		# The process exists, it just belongs to someone else
+		return True
+
+	return True
 
 def clear_vt100_escape_codes(data :Union[bytes, str]):
 	# https://stackoverflow.com/a/43627833/929999
-	if type(data) == bytes:
-		vt100_escape_regex = bytes(r'\x1B\[[?0-9;]*[a-zA-Z]', 'UTF-8')
-	else:
-		vt100_escape_regex = r'\x1B\[[?0-9;]*[a-zA-Z]'
-
-	for match in re.findall(vt100_escape_regex, data, re.IGNORECASE):
-		data = data.replace(match, '' if type(data) == str else b'')
+	if isinstance(data, bytes):
+		return _VT100_ESCAPE_BYTES.sub(b'', data)
 
-	return data
\ No newline at end of file
+	return _VT100_ESCAPE_STR.sub('', data)
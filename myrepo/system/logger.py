@@ -1,21 +1,40 @@
+import atexit
 import logging
 import os
 import sys
 import json
+import threading
 from pathlib import Path
-from typing import Dict, Union, Optional, cast, Any
+from typing import Dict, Union, Optional, TextIO, cast, Any
 
 from ..environment.storage import storage
 from ..parsers.json import JSON
 
-try:
-	import systemd.journal
-	log_adapter :Optional[logging.Logger] = logging.getLogger('ourkvm')
-	if log_adapter:
-		log_adapter.addHandler(systemd.journal.JournalHandler())
-		log_adapter.setLevel(logging.INFO)
-except ModuleNotFoundError:
-	log_adapter = None
+log_adapter :Optional[logging.Logger] = None
+_log_adapter_loaded = False
+_log_adapter_lock = threading.Lock()
+_log_file_lock = threading.Lock()
+
+def _get_adapter() -> Optional[logging.Logger]:
+	"""
+	Sets up the ``journald`` log adapter on first use, as importing
+	``systemd.journal`` is fairly expensive and not needed for every run.
+	"""
+	global log_adapter, _log_adapter_loaded
+
+	if not _log_adapter_loaded:
+		with _log_adapter_lock:
+			if not _log_adapter_loaded:
+				try:
+					import systemd.journal
+					log_adapter = logging.getLogger('ourkvm')
+					log_adapter.addHandler(systemd.journal.JournalHandler())
+					log_adapter.setLevel(logging.INFO)
+				except ModuleNotFoundError:
+					log_adapter = None
+				_log_adapter_loaded = True
+
+	return log_adapter
 
 class Journald:
 	@staticmethod
@@ -23,7 +42,7 @@ class Journald:
 		"""
 		Logs a given message with a given level to ``systemd``'s ``journald``.
 		"""
-		if log_adapter:
+		if (log_adapter := _get_adapter()):
 			log_adapter.log(level, message)
 
 			return True
@@ -44,38 +63,77 @@ def supports_color() -> bool:
 	return supported_platform and is_a_tty
 
 
+# The terminal doesn't change during a run, no need to check it for every log line
+_SUPPORTS_COLOR = supports_color()
+
+_OPT_DICT = {'bold': '1', 'italic': '3', 'underscore': '4', 'blink': '5', 'reverse': '7', 'conceal': '8'}
+_COLOR_NAMES = ('black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white')
+_FG = {_COLOR_NAMES[x]: '3%s' % x for x in range(8)}
+_BG = {_COLOR_NAMES[x]: '4%s' % x for x in range(8)}
+_RESET = '0'
+
 # Heavily influenced by: https://github.com/django/django/blob/ae8338daf34fd746771e0678081999b656177bae/django/utils/termcolors.py#L13
 # Color options here: https://askubuntu.com/questions/528928/how-to-do-underline-bold-italic-strikethrough-color-background-and-size-i
 def stylize_output(text: str, *opts :str, **kwargs :Union[str, int, Dict[str, Union[str, int]]]) -> str:
 	"""
 	Adds styling to a text given a set of color arguments.
 	"""
-	opt_dict = {'bold': '1', 'italic': '3', 'underscore': '4', 'blink': '5', 'reverse': '7', 'conceal': '8'}
-	color_names = ('black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white')
-	foreground = {color_names[x]: '3%s' % x for x in range(8)}
-	background = {color_names[x]: '4%s' % x for x in range(8)}
-	reset = '0'
-
 	code_list = []
 	if text == '' and len(opts) == 1 and opts[0] == 'reset':
-		return '\x1b[%sm' % reset
+		return '\x1b[%sm' % _RESET
 
 	for k, v in kwargs.items():
 		if k == 'fg':
-			code_list.append(foreground[str(v)])
+			code_list.append(_FG[str(v)])
 		elif k == 'bg':
-			code_list.append(background[str(v)])
+			code_list.append(_BG[str(v)])
 
 	for o in opts:
-		if o in opt_dict:
-			code_list.append(opt_dict[o])
+		if o in _OPT_DICT:
+			code_list.append(_OPT_DICT[o])
 
 	if 'noreset' not in opts:
-		text = '%s\x1b[%sm' % (text or '', reset)
+		text = '%s\x1b[%sm' % (text or '', _RESET)
 
 	return '%s%s' % (('\x1b[%sm' % ';'.join(code_list)), text or '')
 
 
+def _log_file_handle(filename :str) -> TextIO:
+	"""
+	Returns the file handle of the log file, opening it on first use.
+	The handle is kept open (and line buffered) for the rest of the run.
+	"""
+	absolute_logfile = os.path.join(storage.get('LOG_PATH', './'), filename)
+
+	if (log_file := storage.get('_log_fh')) and log_file.name == absolute_logfile:
+		return cast(TextIO, log_file)
+
+	err_string = None
+	with _log_file_lock:
+		if (log_file := storage.get('_log_fh')) and log_file.name == absolute_logfile:
+			return cast(TextIO, log_file)
+
+		try:
+			Path(absolute_logfile).parents[0].mkdir(exist_ok=True, parents=True)
+			log_file = open(absolute_logfile, 'a', buffering=1)
+		except PermissionError:
+			# Fallback to creating the log file in the current folder
+			err_string = f"Not enough permission to place log file at {absolute_logfile}, creating it in {Path('./').absolute() / filename} instead."
+			storage['LOG_PATH'] = './'
+			log_file = open(os.path.join('./', filename), 'a', buffering=1)
+
+		if (previous_log_file := storage.get('_log_fh')):
+			previous_log_file.close()
+
+		storage['_log_fh'] = log_file
+		atexit.register(log_file.close)
+
+	if err_string:
+		log(err_string, fg="red")
+
+	return cast(TextIO, log_file)
+
+
 def log(*args :Any, **kwargs :Union[str, int, Dict[str, Union[str, int]]]) -> None:
 	"""
 	A wrapper for :class:`Journald`'s ``.log``, but adds color if supported.
@@ -87,30 +145,14 @@ def log(*args :Any, **kwargs :Union[str, int, Dict[str, Union[str, int]]]) -> No
 
 	# Attempt to colorize the output if supported
 	# Insert default colors and override with **kwargs
-	if supports_color():
+	if _SUPPORTS_COLOR:
 		kwargs = {'fg': 'white', **kwargs}
 		string = stylize_output(string, **kwargs)
 
 	# If a logfile is defined in storage,
 	# we use that one to output everything
 	if filename := storage.get('LOG_FILE', None):
-		absolute_logfile = os.path.join(storage.get('LOG_PATH', './'), filename)
-
-		try:
-			Path(absolute_logfile).parents[0].mkdir(exist_ok=True, parents=True)
-			with open(absolute_logfile, 'a') as log_file:
-				log_file.write("")
-		except PermissionError:
-			# Fallback to creating the log file in the current folder
-			err_string = f"Not enough permission to place log file at {absolute_logfile}, creating it in {Path('./').absolute() / filename} instead."
-			absolute_logfile = Path('./').absolute() / filename
-			absolute_logfile.parents[0].mkdir(exist_ok=True)
-			absolute_logfile = str(absolute_logfile)
-			storage['LOG_PATH'] = './'
-			log(err_string, fg="red")
-
-		with open(absolute_logfile, 'a') as log_file:
-			log_file.write(f"{orig_string}\n")
+		_log_file_handle(filename).write(f"{orig_string}\n")
 
 	Journald.log(string, level=int(str(kwargs.get('level', logging.INFO))))
 
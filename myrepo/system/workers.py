@@ -1,9 +1,10 @@
+import codecs
 import logging
 import os
 import shlex
 import sys
 import time
-from typing import Callable, Dict, List, Any, Optional, Union, Iterator, cast
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union, Iterator, cast
 
 if sys.platform == 'linux':
 	from select import epoll as epoll
@@ -22,19 +23,27 @@ else:
 		def __init__(self) -> None:
 			self.sockets: Dict[str, Any] = {}
 			self.monitoring: Dict[int, Any] = {}
+			# The list handed to select(), only rebuilt when the monitored fds change
+			self._fd_list_cache: Optional[List[int]] = None
 
 		def unregister(self, fileno :int, *args :List[Any], **kwargs :Dict[str, Any]) -> None:
 			try:
 				del(self.monitoring[fileno])
 			except: # nosec
 				pass
+			self._fd_list_cache = None
 
 		def register(self, fileno :int, *args :int, **kwargs :Dict[str, Any]) -> None:
 			self.monitoring[fileno] = True
+			self._fd_list_cache = None
 
 		def poll(self, timeout: float = 0.05, *args :str, **kwargs :Dict[str, Any]) -> List[Any]:
+			if self._fd_list_cache is None:
+				self._fd_list_cache = list(self.monitoring.keys())
+
 			try:
-				return [[fileno, 1] for fileno in select.select(list(self.monitoring.keys()), [], [], timeout)[0]]
+				# epoll() treats a negative timeout as "block until ready", select() wants None for that
+				return [(fileno, 1) for fileno in select.select(self._fd_list_cache, [], [], timeout if timeout >= 0 else None)[0]]
 			except OSError:
 				return []
 
@@ -51,7 +60,8 @@ class SysCommandWorker:
 		environment_vars :Optional[Dict[str, Any]] = None,
 		logfile :Optional[None] = None,
 		working_directory :Optional[str] = './',
-		remove_vt100_escape_codes_from_lines :bool = True):
+		remove_vt100_escape_codes_from_lines :bool = True,
+		use_pty :bool = True):
 		"""
 		A general purpose system-command class which can execute and communicate
 		with a spawned process. It also supports communicating with sub-tty's which
@@ -59,6 +69,8 @@ class SysCommandWorker:
 		This class requires the user of it to poll periodicly for output, otherwise
 		the process will hang/freeze. For a more convenient method of
 		calling system-commands, use the class :ref:`SysCommand` instead.
+		``use_pty=False`` spawns the process with a plain pipe for output instead,
+		which is a lot cheaper but means the process can't be interacted with.
 		"""
 
 		if not callbacks:
@@ -66,31 +78,42 @@ class SysCommandWorker:
 		if not environment_vars:
 			environment_vars = {}
 
-		if type(cmd) is str:
+		if isinstance(cmd, str):
 			cmd = shlex.split(cmd)
 
-		cmd = list(cmd) # This is to please mypy
+		if not isinstance(cmd, list):
+			cmd = list(cmd) # This is to please mypy
 		if cmd[0][0] != '/' and cmd[0][:2] != './':
 			# "which" doesn't work as it's a builtin to bash.
 			# It used to work, but for whatever reason it doesn't anymore.
 			# We there for fall back on manual lookup in os.PATH
-			cmd[0] = locate_binary(cmd[0])
+			# (A new list, so that we don't modify the callers list)
+			cmd = [locate_binary(cmd[0]), *cmd[1:]]
 
 		self.cmd = cmd
 		self.callbacks = callbacks
 		self.peak_output = peak_output
 		self.environment_vars = environment_vars
+		# Built once, and without copying os.environ when there's nothing to add to it
+		self._exec_env = {**os.environ, **environment_vars} if environment_vars else os.environ
 		self.logfile = logfile
 		self.working_directory = working_directory
+		# posix_spawn() is not available everywhere, fall back on a pty when it's missing
+		self.use_pty = use_pty or not hasattr(os, 'posix_spawn')
 
 		self.exit_code :Optional[int] = None
-		self._trace_log :bytes = b''
+		# A bytearray grows in place, instead of copying the whole log on every append
+		self._trace_log = bytearray()
 		self._trace_log_pos = 0
+		# Reads land in this pre-allocated buffer, rather than
+		# allocating a new object for every read.
+		self._read_buffer = bytearray(65536)
 		self.poll_object = epoll()
 		self.child_fd :Optional[int] = None
 		self.started :Optional[float] = None
 		self.ended :Optional[float] = None
 		self.remove_vt100_escape_codes_from_lines :bool = remove_vt100_escape_codes_from_lines
+		self._peak_decoder = codecs.getincrementaldecoder('UTF-8')(errors='replace')
 
 	def __contains__(self, key: bytes) -> bool:
 		"""
@@ -98,34 +121,42 @@ class SysCommandWorker:
 		This is to avoid re-checking the same data when looking for output.
 		Contains allows us to do ``b"some string" in SysCommandWorker("...")``.
 		"""
-		if type(key) != bytes:
+		if not isinstance(key, bytes):
 			raise AssertionError(f"SysCommand* requires comparison key to be bytes() when doing `x in SysCommand*('...')`")
 
-		if (contains := key in self._trace_log[self._trace_log_pos:]):
-			self._trace_log_pos += self._trace_log[self._trace_log_pos:].find(key) + len(key)
+		# find() with a start offset searches in place, slicing would copy the whole tail of the log
+		if (index := self._trace_log.find(key, self._trace_log_pos)) < 0:
+			return False
 
-		return contains
+		self._trace_log_pos = index + len(key)
+		return True
 
 	def __iter__(self, *args :str, **kwargs :Dict[str, Any]) -> Iterator[bytes]:
 		"""
 		Iterates over the current lines in the trace buffert.
 		This will move the buffert position forward.
 		"""
-		for line in self._trace_log[self._trace_log_pos:self._trace_log.rfind(b'\n')].split(b'\n'):
-			if line:
-				if self.remove_vt100_escape_codes_from_lines:
-					line = clear_vt100_escape_codes(line)
+		# Only complete lines are handed out, anything after the last newline is left for next time
+		if (last_newline := self._trace_log.rfind(b'\n', self._trace_log_pos)) < 0:
+			return
+
+		lines = bytes(memoryview(self._trace_log)[self._trace_log_pos:last_newline])
+		if self.remove_vt100_escape_codes_from_lines:
+			# One pass over all the lines, escape codes never span a newline
+			lines = clear_vt100_escape_codes(lines)
 
+		for line in lines.split(b'\n'):
+			if line:
 				yield line + b'\n'
 
-		self._trace_log_pos = self._trace_log.rfind(b'\n')
+		self._trace_log_pos = last_newline
 
 	def __repr__(self) -> str:
 		"""
 		Returns a string representation of the trace log.
 		"""
 		self.make_sure_we_are_executing()
-		return str(self._trace_log)
+		return str(bytes(self._trace_log))
 
 	def __enter__(self) -> 'SysCommandWorker':
 		"""
@@ -177,7 +208,7 @@ class SysCommandWorker:
 		"""
 		Writes bytes data to the spawned process using `os.write` to the childs file descriptor.
 		"""
-		if type(data) != bytes:
+		if not isinstance(data, bytes):
 			raise AssertionError(f"SysCommand*.write() requires bytes-data and not {type(data)}")
 
 		self.make_sure_we_are_executing()
@@ -219,49 +250,81 @@ class SysCommandWorker:
 		output data if ``.peak_output`` was set on ``SysCommandWorker()``
 		"""
 		if self.peak_output:
-			if type(output) == bytes:
-				try:
-					output = output.decode('UTF-8')
-				except UnicodeDecodeError:
-					return False
+			if isinstance(output, bytes):
+				# Keeps multi-byte characters that are split across two reads intact
+				output = self._peak_decoder.decode(output)
 
 			sys.stdout.write(str(output))
 			sys.stdout.flush()
 
 		return True
 
-	def poll(self) -> bool:
+	def poll(self, timeout :float = 0.1) -> bool:
 		"""
 		This function will return ``True`` if there was data retrieved.
 		It will also do some health checks on the process and if it ended,
 		this function will set a ```time of death`` for the process and a ``.exit_code``.
+		``timeout`` is how long to wait for output, a negative value blocks until
+		there is output or the process hangs up.
 		"""
 		self.make_sure_we_are_executing()
 
 		got_output = False
+		hung_up = False
 		if self.child_fd:
-			for fileno, event in self.poll_object.poll(0.1):
-				try:
-					output = os.read(self.child_fd, 8192)
+			for fileno, event in self.poll_object.poll(timeout):
+				# Drain everything that is buffered up, rather than one read per wake up
+				while True:
+					try:
+						read = os.readv(self.child_fd, [self._read_buffer])
+					except BlockingIOError:
+						break
+					except OSError:
+						hung_up = True
+						break
+
+					if not read:
+						# A pipe signals EOF with an empty read, where a pty raises OSError
+						hung_up = True
+						break
+
 					got_output = True
-					self.peak(output)
-					self._trace_log += output
-				except OSError:
-					self.ended = time.time()
+					# Appended straight from the read buffer, a copy is only made when there's output to show
+					self._trace_log.extend(memoryview(self._read_buffer)[:read])
+					if self.peak_output:
+						self.peak(bytes(memoryview(self._read_buffer)[:read]))
+
+				if hung_up:
 					break
 
-			if self.ended or (got_output is False and pid_exists(self.pid) is False):
-				self.ended = time.time()
-				try:
-					self.exit_code = os.waitpid(self.pid, 0)[1]
-				except ChildProcessError:
-					try:
-						self.exit_code = os.waitpid(self.child_fd, 0)[1]
-					except ChildProcessError:
-						self.exit_code = 1
+			if hung_up or (got_output is False and pid_exists(self.pid) is False):
+				# If the process is still around after closing its output,
+				# we'll try again on the next poll instead of blocking here.
+				if (exit_code := self._reap()) is not None:
+					self.ended = time.time()
+					self.exit_code = exit_code
 
 		return got_output
 
+	def _reap(self) -> Optional[int]:
+		"""
+		Collects the exit code of the ended process, waiting up to about a second
+		for it to exit. Returns ``None`` if it is still running after that.
+		"""
+		try:
+			for attempt in range(100):
+				pid, status = os.waitpid(self.pid, os.WNOHANG)
+				if pid:
+					# The raw status is the exit code shifted by 8 bits, or the signal that killed the process
+					return os.waitstatus_to_exitcode(status)
+
+				time.sleep(0.001 if attempt < 10 else 0.01)
+		except ChildProcessError:
+			# Someone else already collected it, we have no way of knowing the exit code
+			return 1
+
+		return None
+
 	def execute(self) -> bool:
 		"""
 		The main function behind ``SysCommandWorker()``.
@@ -271,41 +334,83 @@ class SysCommandWorker:
 		into a ``poll_object`` which can be used to determine if the process
 		has any output to retrieve, which makes the whole operation non-blocking.
 		"""
-		import pty
+		# Logged from the parent, the child should get to execve() as quickly as possible
+		if storage['arguments'].debug:
+			try:
+				with open(f"{storage.get('LOG_PATH', './')}/cmd_history.txt", "a") as cmd_log:
+					cmd_log.write(f"{' '.join(self.cmd)}\n")
+			except PermissionError:
+				pass
+
+			log(f"Executing: {self.cmd}", level=logging.DEBUG)
 
 		if (old_dir := os.getcwd()) != self.working_directory:
 			os.chdir(str(self.working_directory))
 
+		if not self.use_pty:
+			try:
+				self.pid, self.child_fd = self._spawn()
+			except FileNotFoundError:
+				log(f"{self.cmd[0]} does not exist.", level=logging.ERROR, fg="red")
+				self.started = self.ended = time.time()
+				self.exit_code = 1
+				return False
+			finally:
+				os.chdir(old_dir)
+
+			self.started = time.time()
+			os.set_blocking(self.child_fd, False)
+			self.poll_object.register(self.child_fd, EPOLLIN | EPOLLHUP)
+
+			return True
+
+		import pty
+
 		# Note: If for any reason, we get a Python exception between here
 		#   and until os.close(), the traceback will get locked inside
-		#   stdout of the child_fd object. `os.read(self.child_fd, 8192)` is the
+		#   stdout of the child_fd object. `os.read(self.child_fd, 65536)` is the
 		#   only way to get the traceback without loosing it.
 		self.pid, self.child_fd = pty.fork()
 		os.chdir(old_dir)
 
 		if not self.pid:
 			try:
-				if storage['arguments'].debug:
-					try:
-						with open(f"{storage['LOG_PATH']}/cmd_history.txt", "a") as cmd_log:
-							cmd_log.write(f"{' '.join(self.cmd)}\n")
-					except PermissionError:
-						pass
-
-				os.execve(self.cmd[0], list(self.cmd), {**os.environ, **self.environment_vars}) # nosec
-				if storage['arguments'].get('debug'):
-					log(f"Executing: {self.cmd}", level=logging.DEBUG)
-
-			except FileNotFoundError:
-				log(f"{self.cmd[0]} does not exist.", level=logging.ERROR, fg="red")
-				self.exit_code = 1
-				return False
+				os.execve(self.cmd[0], self.cmd, self._exec_env) # nosec
+			except OSError as error:
+				# The error ends up in the parents trace log through the pty
+				os.write(2, f"Could not execute {self.cmd[0]}: {error}\n".encode())
+			finally:
+				# Never let the child return into the parents Python code
+				os._exit(1)
 
 		self.started = time.time()
+		os.set_blocking(self.child_fd, False)
 		self.poll_object.register(self.child_fd, EPOLLIN | EPOLLHUP)
 
 		return True
 
+	def _spawn(self) -> Tuple[int, int]:
+		"""
+		Spawns the process through ``os.posix_spawn()`` with stdout and stderr
+		going to a pipe and stdin reading from ``/dev/null``.
+		Returns the pid and the reading end of the pipe.
+		"""
+		read_fd, write_fd = os.pipe()
+
+		try:
+			pid = os.posix_spawn(self.cmd[0], self.cmd, self._exec_env, file_actions=[
+				(os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+				(os.POSIX_SPAWN_DUP2, write_fd, 1),
+				(os.POSIX_SPAWN_DUP2, write_fd, 2)
+			]) # nosec
+		except BaseException:
+			os.close(read_fd)
+			raise
+		finally:
+			os.close(write_fd)
+
+		return pid, read_fd
+
 	def decode(self, encoding :str = 'UTF-8') -> str:
 		"""
 		Returns a complete copy of the trace-log in a decoded fasion.
@@ -381,11 +486,11 @@ class SysCommand:
 		if not self.session:
 			raise KeyError(f"SysCommand() does not have an active session.")
 
-		elif type(key) is slice:
+		elif isinstance(key, slice):
 			start = key.start if key.start else 0
 			end = key.stop if key.stop else len(self.session._trace_log)
 
-			return self.session._trace_log[start:end]
+			return bytes(memoryview(self.session._trace_log)[start:end])
 		else:
 			raise ValueError("SysCommand() doesn't have key & value pairs, only slices, SysCommand('ls')[:10] as an example.")
 
@@ -419,12 +524,26 @@ class SysCommand:
 		if self.session:
 			return self.session
 
-		with SysCommandWorker(self.cmd, callbacks=self._callbacks, peak_output=self.peak_output, environment_vars=self.environment_vars, remove_vt100_escape_codes_from_lines=self.remove_vt100_escape_codes_from_lines) as session:
+		# Nothing can interact with the process before it has ended, so unless
+		# the output is shown live, a pipe is all we need instead of a pty.
+		use_pty = bool(self._callbacks or self.peak_output)
+
+		with SysCommandWorker(
+				self.cmd,
+				callbacks=self._callbacks,
+				peak_output=self.peak_output,
+				environment_vars=self.environment_vars,
+				remove_vt100_escape_codes_from_lines=self.remove_vt100_escape_codes_from_lines,
+				use_pty=use_pty
+		) as session:
+
 			if not self.session:
 				self.session = session
 
+			# Block in the kernel until there's output or the process hangs up,
+			# rather than waking up every 100ms to check on it.
 			while self.session.ended is None:
-				self.session.poll()
+				self.session.poll(timeout=-1)
 
 		if self.peak_output:
 			sys.stdout.write('\n')
@@ -459,5 +578,5 @@ class SysCommand:
 		without moving the trace-log pointer.
 		"""
 		if self.session:
-			return self.session._trace_log
+			return bytes(self.session._trace_log)
 		return None
\ No newline at end of file
@@ -0,0 +1,140 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pathlib
+import socket
+import time
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+from ..system.logger import log
+
+CACHE_DIR = pathlib.Path('~/.cache/myrepo').expanduser()
+MIRROR_CACHE = CACHE_DIR/'mirrors.json'
+MIRROR_CACHE_MAX_AGE = 7 * 24 * 60 * 60 # One week, in seconds
+MIRROR_LATENCY_THRESHOLD = 500_000_000 # Half a second, in nanoseconds
+MIRROR_SHORTLIST_SIZE = 10
+
+
+def parse_mirror_list(mirror_list :pathlib.Path) -> Dict[str, None]:
+	"""
+	Parses the ``Server = <url>`` definitions of a pacman mirrorlist.
+	The result is cached on disk, one file per mirrorlist path, and re-used
+	as long as the mirrorlist's mtime and size haven't changed.
+	"""
+	stat = mirror_list.stat()
+	# Hashing the path gives a safe file name, and edits overwrite the same cache file
+	cache_file = CACHE_DIR/f"mirrorlist-{hashlib.blake2b(str(mirror_list).encode(), digest_size=16).hexdigest()}.json"
+
+	try:
+		with cache_file.open('r') as fh:
+			cache = json.load(fh)
+
+		if cache.get('mirror_list') == str(mirror_list) and cache.get('mtime') == stat.st_mtime_ns and cache.get('size') == stat.st_size:
+			return {url: None for url in cache['mirrors']}
+	except (OSError, ValueError, KeyError, TypeError, AttributeError):
+		pass
+
+	mirrors :Dict[str, None] = {}
+	# mmap() refuses empty files, and there's nothing to parse in them anyway
+	if stat.st_size:
+		# Scanning the raw bytes means we only decode the URLs,
+		# not the (mostly commented out) remainder of the file.
+		with mirror_list.open('rb') as raw, mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+			for line in iter(mapped.readline, b''):
+				if line[:1] == b'#':
+					continue
+
+				key, separator, url = line.partition(b'=')
+				if separator and key.strip().lower() == b'server':
+					mirrors[url.strip().decode()] = None
+
+	try:
+		CACHE_DIR.mkdir(parents=True, exist_ok=True)
+		# Write to a temporary file first, so that a concurrent run never reads a half written cache
+		with (temporary_file := cache_file.with_suffix(f".{os.getpid()}.tmp")).open('w') as fh:
+			json.dump({
+				'mirror_list': str(mirror_list),
+				'mtime': stat.st_mtime_ns,
+				'size': stat.st_size,
+				'mirrors': list(mirrors)
+			}, fh)
+		os.replace(temporary_file, cache_file)
+	except OSError as error:
+		log(f"Could not cache the parsed mirrorlist in {cache_file}: {error}", level=logging.DEBUG)
+
+	return mirrors
+
+def probe_mirror(url :str, timeout :float = 2) -> Optional[int]:
+	"""
+	Measures how long it takes to establish a TCP connection to a mirror.
+	Returns the elapsed time in nanoseconds, or ``None`` if the mirror could not be reached.
+	"""
+	parsed = urllib.parse.urlparse(url)
+	if not parsed.hostname:
+		return None
+
+	port = parsed.port or (80 if parsed.scheme == 'http' else 443)
+
+	started = time.monotonic_ns()
+	try:
+		with socket.create_connection((parsed.hostname, port), timeout=timeout):
+			pass
+	except OSError:
+		return None
+
+	return time.monotonic_ns() - started
+
+def _load_shortlist(mirror_list :pathlib.Path) -> Optional[List[str]]:
+	try:
+		with MIRROR_CACHE.open('r') as fh:
+			cache = json.load(fh)
+	except (OSError, ValueError):
+		return None
+
+	if cache.get('mirror_list') != str(mirror_list) or cache.get('mtime') != mirror_list.stat().st_mtime_ns:
+		return None
+	if time.time() - cache.get('created', 0) > MIRROR_CACHE_MAX_AGE:
+		return None
+	if cache.get('latency') is None or cache['latency'] > MIRROR_LATENCY_THRESHOLD:
+		# The best mirror was too slow last time, it's worth probing again
+		return None
+
+	return cache.get('mirrors') or None
+
+def _store_shortlist(mirror_list :pathlib.Path, ranked :List[Tuple[int, str]]) -> None:
+	try:
+		MIRROR_CACHE.parent.mkdir(parents=True, exist_ok=True)
+		with MIRROR_CACHE.open('w') as fh:
+			json.dump({
+				'mirror_list': str(mirror_list),
+				'mtime': mirror_list.stat().st_mtime_ns,
+				'created': time.time(),
+				'latency': ranked[0][0],
+				'mirrors': [url for latency, url in ranked]
+			}, fh)
+	except OSError as error:
+		log(f"Could not store mirror shortlist in {MIRROR_CACHE}: {error}", level=logging.DEBUG)
+
+def rank_mirrors(mirrors :Dict[str, None], mirror_list :pathlib.Path, keep :int = MIRROR_SHORTLIST_SIZE) -> Dict[str, None]:
+	"""
+	Orders the given mirrors by connection latency and keeps the ``keep`` fastest ones.
+	The shortlist is cached on disk and re-used as long as ``mirror_list`` hasn't changed.
+	"""
+	if (shortlist := _load_shortlist(mirror_list)):
+		log(f"Using cached mirror shortlist from {MIRROR_CACHE}", level=logging.DEBUG)
+		return {url: None for url in shortlist}
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=32) as executor:
+		latencies = dict(zip(mirrors, executor.map(probe_mirror, mirrors)))
+
+	ranked = sorted((latency, url) for url, latency in latencies.items() if latency is not None)[:keep]
+	if not ranked:
+		log(f"None of the mirrors responded, keeping the order of {mirror_list}", level=logging.WARNING, fg="red")
+		return mirrors
+
+	_store_shortlist(mirror_list, ranked)
+
+	return {url: None for latency, url in ranked}
@@ -1,61 +1,157 @@
+import concurrent.futures
+import functools
+import http.client
+import operator
+import os
 import pathlib
+import queue
+import re
 import ssl
+import threading
+import urllib.parse
 import urllib.request
-import json
 import logging
-import glob
-from typing import List
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Type
 from ..system.logger import log
 from ..system.workers import SysCommand
 from ..models import PackageSearch, PackageSearchResult
-from ..exceptions import PackageError, SysCallError
+from ..exceptions import PackageError, RepositoryError, SysCallError
 from ..environment.storage import storage
+from .versions import vercmp
+
+try:
+	from orjson import loads as json_loads
+except ModuleNotFoundError:
+	from json import loads as json_loads # type: ignore
+
+# With httpx (and h2) installed, all package downloads from a mirror are multiplexed
+# over a single HTTP/2 connection instead of a new connection per file.
+# DOWNLOAD_ERRORS are the errors after which the next mirror is tried: URLError is an OSError,
+# and OSError/HTTPException also cover transfers that break off mid-body (timeouts, resets, IncompleteRead).
+try:
+	import httpx
+	_http_client :Optional['httpx.Client'] = httpx.Client(http2=True, timeout=30.0, follow_redirects=True, limits=httpx.Limits(max_keepalive_connections=16))
+	DOWNLOAD_ERRORS :Tuple[Type[Exception], ...] = (OSError, http.client.HTTPException, httpx.HTTPError)
+except ImportError:
+	_http_client = None
+	DOWNLOAD_ERRORS = (OSError, http.client.HTTPException)
+
+# A PackageError from a mirror means a corrupt download or an unsupported URL, either way the next mirror is tried
+_MIRROR_ERRORS :Tuple[Type[BaseException], ...] = (*DOWNLOAD_ERRORS, PackageError)
 
 BASE_URL_PKG_SEARCH = 'https://archlinux.org/packages/search/json/?name={package}'
 BASE_URL_PKG_CONTENT = 'https://archlinux.org/packages/search/json/?package={package}'
 BASE_GROUP_URL = 'https://archlinux.org/groups/x86_64/{group}/'
+# Large chunks mean fewer read/write round trips, while memory use stays bounded
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# How many of the (ranked) mirrors to race against each other once per repository
+MIRROR_RACE_SIZE = 8
+MIRROR_PROBE_TIMEOUT = 5
+# Number of packages resolved against archlinux.org at the same time
+SYNC_WORKERS = 8
+# Number of packages downloaded from the mirrors at the same time
+DOWNLOAD_WORKERS = 8
+
+# A package name and an optional (operator, version) constraint
+Dependency = Tuple[str, Optional[Tuple[str, str]]]
+# Splits dependency definitions such as ``glibc>=2.34`` into name, operator and version
+_CONSTRAINT_RE = re.compile(r'^([^<>=]+?)(>=|<=|>|<|=)(.+)$')
+_CONSTRAINT_OPERATORS :Dict[str, Callable[[int, int], bool]] = {
+	'>=': operator.ge,
+	'<=': operator.le,
+	'>': operator.gt,
+	'<': operator.lt,
+	'=': operator.eq
+}
+
+# Creating a context loads the CA bundle and cipher lists, so it's shared by all requests
+_SSL_CTX = ssl.create_default_context()
+# One keep-alive connection per thread and host, http.client connections aren't thread safe
+_api_connections = threading.local()
+
+# The mirror that answered first, per (repository, architecture)
+_mirror_races :Dict[Tuple[str, str], 'concurrent.futures.Future[Optional[str]]'] = {}
+_mirror_race_lock = threading.Lock()
+
+# lru_cache doesn't remember exceptions, so packages that couldn't be found are tracked here
+_NEGATIVE_CACHE :Set[str] = set()
+
+def _api_request(url :str) -> Tuple[int, bytes]:
+	"""
+	Performs a GET request against the archlinux.org API and returns the status code and body.
+	Connections are kept alive and re-used, saving a TCP and TLS handshake per lookup.
+	"""
+	if _http_client:
+		response = _http_client.get(url)
+		return response.status_code, response.content
+
+	parsed = urllib.parse.urlsplit(url)
+	target = f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path
 
+	if (connections := getattr(_api_connections, 'connections', None)) is None:
+		connections = _api_connections.connections = {}
 
+	for attempt in range(2):
+		if (connection := connections.get(parsed.netloc)) is None:
+			connection = connections[parsed.netloc] = http.client.HTTPSConnection(parsed.netloc, context=_SSL_CTX, timeout=30)
+
+		try:
+			connection.request('GET', target)
+			response = connection.getresponse()
+			return response.status, response.read()
+		except (http.client.HTTPException, OSError):
+			# The server might have closed the idle connection, retry once on a fresh one
+			connection.close()
+			del connections[parsed.netloc]
+			if attempt:
+				raise
+
+	raise PackageError(f"Could not reach {parsed.netloc}")
+
+@functools.lru_cache(maxsize=4096)
 def find_group(name :str) -> bool:
 	# TODO UPSTREAM: Implement /json/ for the groups search
-	ssl_context = ssl.create_default_context()
-	ssl_context.check_hostname = False
-	ssl_context.verify_mode = ssl.CERT_NONE
-	try:
-		response = urllib.request.urlopen(BASE_GROUP_URL.format(group=name), context=ssl_context)
-	except urllib.error.HTTPError as err:
-		if err.code == 404:
-			return False
-		else:
-			raise err
+	status, _ = _api_request(BASE_GROUP_URL.format(group=name))
 
-	# Just to be sure some code didn't slip through the exception
-	if response.code == 200:
-		return True
+	if status == 404:
+		return False
+	elif status != 200:
+		raise PackageError(f"Could not look up group {name}: [{status}]")
 
-	return False
+	return True
 
+@functools.lru_cache(maxsize=4096)
 def package_search(package :str) -> PackageSearch:
 	"""
 	Finds a specific package via the package database.
-	It makes a simple web-request, which might be a bit slow.
+	It makes a simple web-request, which might be a bit slow,
+	so results are cached for the remainder of the run.
 	"""
 	# TODO UPSTREAM: Implement bulk search, either support name=X&name=Y or split on space (%20 or ' ')
-	ssl_context = ssl.create_default_context()
-	ssl_context.check_hostname = False
-	ssl_context.verify_mode = ssl.CERT_NONE
-	response = urllib.request.urlopen(BASE_URL_PKG_SEARCH.format(package=package), context=ssl_context)
+	status, body = _api_request(BASE_URL_PKG_SEARCH.format(package=package))
 
-	if response.code != 200:
-		raise PackageError(f"Could not locate package: [{response.code}] {response}")
+	if status != 200:
+		raise PackageError(f"Could not locate package: [{status}] {package}")
 
-	data = response.read().decode('UTF-8')
-	return PackageSearch(**json.loads(data))
+	# Both parsers accept the raw bytes, which saves decoding into an intermediate str
+	return PackageSearch(**json_loads(body))
 
-class IsGroup(BaseException):
+class IsGroup(Exception):
 	pass
 
+@functools.lru_cache(maxsize=4096)
 def find_package(package :str) -> PackageSearchResult:
+	if package in _NEGATIVE_CACHE:
+		raise PackageError(f"Could not locate {package} (cached)")
+
+	try:
+		return _find_package(package)
+	except PackageError:
+		_NEGATIVE_CACHE.add(package)
+		raise
+
+def _find_package(package :str) -> PackageSearchResult:
 	data = package_search(package)
 
 	if not data.results:
@@ -75,228 +171,390 @@ def find_package(package :str) -> PackageSearchResult:
 
 	raise PackageError(f"Could not locate {package} in result while looking for repository category")
 
-def download_package(package :str, repo :str, url :str, destination :pathlib.Path, filename :str, include_signature=True) -> bool:
+def clear_caches() -> None:
+	"""
+	Forgets all cached package and group lookups, positive and negative.
+	"""
+	find_group.cache_clear()
+	package_search.cache_clear()
+	find_package.cache_clear()
+	_NEGATIVE_CACHE.clear()
+
+def download_file(url :str, destination :pathlib.Path) -> int:
+	"""
+	Streams ``url`` to ``destination`` in chunks, packages can be hundreds of MB.
+	Returns the number of bytes written.
+	Raises one of ``DOWNLOAD_ERRORS`` if the download fails.
+	"""
+	size = 0
+
+	with destination.open('wb') as output:
+		if _http_client:
+			with _http_client.stream('GET', url) as response:
+				response.raise_for_status()
+				for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+					size += output.write(chunk)
+		else:
+			with urllib.request.urlopen(url, context=_SSL_CTX) as response:
+				while (chunk := response.read(DOWNLOAD_CHUNK_SIZE)):
+					size += output.write(chunk)
+
+	return size
+
+def probe_url(url :str) -> bool:
+	"""
+	Sends a HEAD request to ``url``, returns ``True`` if the mirror has the file.
+	"""
+	try:
+		if _http_client:
+			return _http_client.head(url, timeout=MIRROR_PROBE_TIMEOUT).is_success
+		else:
+			with urllib.request.urlopen(urllib.request.Request(url, method='HEAD'), timeout=MIRROR_PROBE_TIMEOUT, context=_SSL_CTX) as response:
+				return response.status == 200
+	except DOWNLOAD_ERRORS:
+		return False
+
+@functools.lru_cache(maxsize=None)
+def _init_database(database_path :pathlib.Path) -> None:
+	"""
+	Creates an empty repository database, once per run and only if it doesn't exist.
+	"""
+	if database_path.exists():
+		return
+
+	try:
+		SysCommand(f"repo-add {database_path} __init__")
+	except SysCallError as error:
+		if error.exit_code not in (0, 1):
+			raise RepositoryError(f"Could not initiate repository {database_path}: [{error.exit_code}] {error}")
+
+def download_package(package :str, repo :str, url :str, destination :pathlib.Path, filename :str, include_signature=True, size :Optional[int] = None) -> bool:
+	"""
+	Downloads a package, and optionally its signature, from ``url``.
+	If ``size`` is given the download is verified against it,
+	a mismatch discards the download and raises a ``PackageError``.
+	"""
 
 	if (url := urllib.parse.urlparse(url)).scheme and url.scheme in ('https', 'http'):
 		destination.mkdir(parents=True, exist_ok=True)
 
 		# If it's a repository we haven't configured yet:
-		database_path = destination/f"{repo}.db.tar.gz"
+		_init_database(destination/f"{repo}.db.tar.gz")
+
+		# Downloads go to .part files, which are only moved into place once complete and verified.
+		# That way an interrupted download is never mistaken for a cached package on the next run.
+		files = {destination/filename: destination/f"{filename}.part"}
+		if include_signature:
+			files[destination/f"{filename}.sig"] = destination/f"{filename}.sig.part"
 
 		try:
-			SysCommand(f"repo-add {database_path} __init__")
-		except SysCallError as error:
-			if error.exit_code not in (0, 256):
-				raise RepositoryError(f"Could not initiate repository {database_path}: [{error.exit_code}] {error}")
+			if include_signature:
+				# Fetch the signature alongside the package rather than after it
+				with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+					transfers = [
+						executor.submit(download_file, url.geturl(), files[destination/filename]),
+						executor.submit(download_file, f"{url.geturl()}.sig", files[destination/f"{filename}.sig"])
+					]
+
+				# Re-raises any download error
+				downloaded_size = transfers[0].result()
+				transfers[1].result()
+			else:
+				downloaded_size = download_file(url.geturl(), files[destination/filename])
 
-		with (destination/filename).open('wb') as output:
-			output.write(urllib.request.urlopen(url.geturl()).read())
+			if size is not None and downloaded_size != size:
+				raise PackageError(f"Download of {filename} from {url.geturl()} is corrupt: got {downloaded_size} bytes, expected {size}")
 
-		if include_signature:
-			with (destination/f"{filename}.sig").open('wb') as output:
-				output.write(urllib.request.urlopen(f"{url.geturl()}.sig").read())
+			# The package goes last, its presence is what marks the download as done
+			for final, partial in reversed(files.items()):
+				os.replace(partial, final)
+		finally:
+			for partial in files.values():
+				partial.unlink(missing_ok=True)
 
 		return True
 
 	raise PackageError(f"Unknown or unsupported URL scheme when downloading package: {[url.scheme]}")
 
-class VersionDef:
-	major = None
-	minor = None
-	patch = None
+@functools.lru_cache(maxsize=1024)
+def _mirror_template(mirror :str, repo :str, architecture :str) -> str:
+	"""
+	Expands ``$repo`` and ``$arch`` of a mirror definition, which stay the same for every
+	package in a repository, leaving only ``$package`` to be filled in per download.
+	"""
+	if not '$package' in mirror:
+		mirror += '/$package'
+
+	return mirror.replace('$repo', repo).replace('$arch', architecture)
 
-	def __init__(self, version_string :str):
-		self.version_raw = version_string
-		if '.' in version_string:
-			self.versions = version_string.split('.')
+def _race_mirrors(urls :Dict[str, str]) -> Optional[str]:
+	"""
+	Probes the first ``MIRROR_RACE_SIZE`` mirrors concurrently and returns the first one to respond.
+	"""
+	racing = list(urls)[:MIRROR_RACE_SIZE]
+	if len(racing) < 2:
+		return None
+
+	executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(racing))
+	probes = {executor.submit(probe_url, urls[mirror]): mirror for mirror in racing}
+	try:
+		for probe in concurrent.futures.as_completed(probes, timeout=MIRROR_PROBE_TIMEOUT * 2):
+			if probe.result():
+				return probes[probe]
+	except concurrent.futures.TimeoutError:
+		pass
+	finally:
+		# Don't hold the downloads back waiting for slower mirrors
+		executor.shutdown(wait=False, cancel_futures=True)
+
+	return None
+
+def _fastest_mirror(repo :str, architecture :str, urls :Dict[str, str]) -> Optional[str]:
+	"""
+	Returns the mirror that won the race for this repository, see ``_race_mirrors()``.
+	The race is only run once per repository, later packages re-use the winner.
+	"""
+	# The lock only covers finding the race, so that waiting on one repository's race never blocks another
+	with _mirror_race_lock:
+		if (race := _mirror_races.get((repo, architecture))) is not None:
+			running_race = False
 		else:
-			self.versions = [version_string]
+			race = _mirror_races[(repo, architecture)] = concurrent.futures.Future()
+			running_race = True
 
-		if '-' in self.versions[-1]:
-			version, patch_version = self.versions[-1].split('-', 1)
-			self.verions = self.versions[:-1] + [version]
-			self.patch = patch_version
+	if not running_race:
+		return race.result()
 
-		self.major = self.versions[0]
-		if len(self.versions) >= 2:
-			self.minor = self.versions[1]
-		if len(self.versions) >= 3:
-			self.patch = self.versions[2]
+	try:
+		winner = _race_mirrors(urls)
+	except BaseException as error:
+		race.set_exception(error)
+		raise
 
-	def __eq__(self, other :'VersionDef') -> bool:
-		if other.major == self.major and \
-			other.minor == self.minor and \
-			other.patch == self.patch:
+	race.set_result(winner)
+	return winner
 
-			return True
-		return False
-		
-	def __lt__(self, other :'VersionDef') -> bool:
-		print(f"Comparing {self} against {other}")
-		if self.major > other.major:
-			return False
-		elif self.minor and other.minor and self.minor > other.minor:
-			return False
-		elif self.patch and other.patch and self.patch > other.patch:
-			return False
-
-	def __str__(self) -> str:
-		return self.version_raw
-
-def sync_packages(packages :List[str], path :pathlib.Path, skip :List[str] = []) -> List[str]:
-	# package_struct = {}
-
-	repositories_to_update = []
-	for package in packages:
-		# Parsing of dependency version control
-		target_version = None
-		target_version_gt = False
-		target_version_lt = False
-		target_version_gt_or_eq = False
-		target_version_lt_or_eq = False
-		target_version_specific = False
-		if '>=' in package:
-			package, target_version = package.rsplit('>=', 1)
-			target_version_gt_or_eq = VersionDef(target_version)
-		elif '>' in package:
-			package, target_version = package.rsplit('>', 1)
-			target_version_gt = VersionDef(target_version)
-		elif '<=' in package:
-			package, target_version = package.rsplit('<=', 1)
-			target_version_lt_or_eq = VersionDef(target_version)
-		elif '<' in package:
-			package, target_version = package.rsplit('<', 1)
-			target_version_lt = VersionDef(target_version)
-		elif '=' in package:
-			package, target_version = package.rsplit('=', 1)
-
-			if '-' in target_version:
-				minimum, maximum = target_version.split('-', 1)
-				target_version_gt_or_eq = VersionDef(minimum)
-				target_version_lt_or_eq = VersionDef(maximum)
-			else:
-				target_version_specific = VersionDef(target_version)
+def download_from_mirrors(package :str, package_info :PackageSearchResult, database_path :pathlib.Path) -> bool:
+	"""
+	Downloads a package from the first mirror that has it, starting with the
+	mirror that won the race for this repository, see ``_fastest_mirror()``.
+	"""
+	repo = package_info.repo
+	# Looked up once, rather than for every mirror
+	arguments = storage['arguments']
+	architecture = arguments.architecture
+	include_signature = arguments.skip_sig is False
+
+	urls :Dict[str, str] = {}
+	for mirror in storage['mirrors']:
+		urls[mirror] = _mirror_template(mirror, repo, architecture).replace('$package', package_info.filename)
+
+	if (fastest := _fastest_mirror(repo, architecture, urls)):
+		# The fastest mirror goes first, the others are kept in their ranked order as fallback
+		urls = {fastest: urls[fastest], **urls}
+
+	for mirror, mirror_py_friendly in urls.items():
+		log(f"Attempting download from mirror {mirror}", level=logging.DEBUG)
+		log(f"Mirror definition was converted to: {mirror_py_friendly}", level=logging.DEBUG)
+		try:
+			if download_package(package, repo, mirror_py_friendly, database_path, package_info.filename, include_signature=include_signature, size=package_info.compressed_size):
+				return True
+		except _MIRROR_ERRORS as error:
+			log(f"Could not download {package} from mirror {mirror}: {error}", level=logging.WARNING, fg="red")
 
-		if package in skip:
-			log(f"Package {package} already downloaded, skipping!", level=logging.DEBUG)
+	raise PackageError(f"Implement pacman -Syw --cachedir --dbdir ...")
+
+@functools.lru_cache(maxsize=None)
+def _directory_listing(path :pathlib.Path) -> FrozenSet[str]:
+	"""
+	Lists the files in ``path`` once per sync, instead of a stat() per package.
+	"""
+	try:
+		return frozenset(os.listdir(path))
+	except FileNotFoundError:
+		return frozenset()
+
+def _parse_dependencies(definitions :Iterable[str], skip :Set[str]) -> List[Dependency]:
+	"""
+	Splits dependency definitions such as ``glibc>=2.34`` into the package name and an
+	optional (operator, version) constraint, leaving out packages that are already handled.
+	"""
+	dependencies :List[Dependency] = []
+	for definition in definitions:
+		if definition in skip:
 			continue
 
+		# Most definitions have no constraint, so those never reach the regex
+		if '<' not in definition and '>' not in definition and '=' not in definition:
+			dependencies.append((definition, None))
+		elif (match := _CONSTRAINT_RE.match(definition)):
+			package, op, bound = match.groups()
+			if package not in skip:
+				dependencies.append((package, (op, bound)))
 		else:
-			log(f"Synchronizing package: {package}", level=logging.INFO, fg="yellow")
-		
-		try:
-			package_info = find_package(package)
-		except IsGroup:
-			log(f"{package} is a group, not supported yet", level=logging.WARNING, fg="red")
-			continue
-		except PackageError:
-			log(f"{package} could not be located in either of upstream package database or upstream group database, resorting to 'pkgfile'")
-			found_fildep = False
+			dependencies.append((definition, None))
+
+	return dependencies
 
+@dataclass
+class _SyncState:
+	"""
+	The state shared between the workers of a single ``sync_packages()`` run.
+	"""
+	path :pathlib.Path
+	# Where the downloads are submitted, so that they run while resolving carries on
+	executor :concurrent.futures.ThreadPoolExecutor
+	# Packages that are claimed by a worker, or that the caller asked to skip
+	skip :Set[str] = field(default_factory=set)
+	repositories_to_update :Set[str] = field(default_factory=set)
+	downloads :List['concurrent.futures.Future[bool]'] = field(default_factory=list)
+	# Guards all of the above
+	lock :threading.Lock = field(default_factory=threading.Lock)
+
+def sync_packages(packages :List[str], path :pathlib.Path, skip :Iterable[str] = ()) -> Set[str]:
+	"""
+	Resolves and downloads the given packages and all their dependencies.
+	Returns the repositories that received packages and need their database updated.
+
+	Packages are resolved by a pool of workers pulling from a shared queue,
+	so that the metadata lookups of sibling dependencies overlap.
+	"""
+	work :'queue.Queue[Optional[Dependency]]' = queue.Queue()
+	errors :List[BaseException] = []
+	# Files might have been added or removed since the last sync
+	_directory_listing.cache_clear()
+
+	def worker() -> None:
+		while (item := work.get()) is not None:
 			try:
-				for line in SysCommand(f"pkgfile {package}"):
-					target_repo, package_from_pkg = line.split(b'/')
-					package_from_pkg = package_from_pkg.decode().strip()
-					
-					if getattr(storage['repositories'], target_repo.decode()) is False:
-						continue
-
-					repositories_to_update = list(set(repositories_to_update + sync_packages([package_from_pkg], path, skip)))
-					
-					skip.append(package_from_pkg)
-					found_fildep = True
-					package_info = find_package(package_from_pkg)
-					
-					break
-
-				if found_fildep:
-					continue
+				# After the first error we only drain the queue, so that work.join() returns
+				if not errors:
+					package, constraint = item
+					for dependency in _sync_package(package, constraint, state):
+						work.put(dependency)
+			except BaseException as error:
+				with state.lock:
+					errors.append(error)
+			finally:
+				work.task_done()
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_executor:
+		# The skip collection is copied, so that the caller's one isn't modified
+		state = _SyncState(path=path, executor=download_executor, skip=set(skip))
+
+		with concurrent.futures.ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+			for dependency in _parse_dependencies(packages, state.skip):
+				work.put(dependency)
+
+			workers = [executor.submit(worker) for _ in range(SYNC_WORKERS)]
+			work.join()
+
+			# One sentinel per worker to shut them down
+			for _ in workers:
+				work.put(None)
+
+		if errors:
+			raise errors[0]
+
+		for download in concurrent.futures.as_completed(state.downloads):
+			# Re-raises any error from the download
+			download.result()
+
+	return state.repositories_to_update
+
+def _sync_package(package :str, constraint :Optional[Tuple[str, str]], state :_SyncState) -> List[Dependency]:
+	"""
+	Resolves a single package and queues its download, ``constraint`` is an optional (operator, version) pair.
+	Returns the packages that still need to be resolved, such as its dependencies.
+	"""
+	repositories = storage['repositories']
 
-			except SysCallError:
-				# Fallback, use `pacman -Ss` in an attempt to resolve the package
-				for line in SysCommand(f"pacman --color never -Ss {package}"):
-					package_from_pacman, version_def, *_ = line.split(b' ')
-					target_repo, package_from_pacman = package_from_pacman.decode().split('/')
+	# Claim the package, so that no other worker resolves it at the same time
+	with state.lock:
+		if package in state.skip:
+			log(f"Package {package} already downloaded, skipping!", level=logging.DEBUG)
+			return []
 
-					if getattr(storage['repositories'], target_repo) is False:
-						continue
+		state.skip.add(package)
 
-					repositories_to_update = list(set(repositories_to_update + sync_packages([package_from_pacman], path, skip)))
-					package_info = find_package(package_from_pacman)		
+	log(f"Synchronizing package: {package}", level=logging.INFO, fg="yellow")
+	
+	try:
+		package_info = find_package(package)
+	except IsGroup:
+		log(f"{package} is a group, not supported yet", level=logging.WARNING, fg="red")
+		return []
+	except PackageError:
+		log(f"{package} could not be located in either of upstream package database or upstream group database, resorting to 'pkgfile'")
 
-					found_fildep = True
-					break
+		try:
+			# Lines look like: core/bash
+			for line in SysCommand(f"pkgfile {package}"):
+				target_repo, _, package_from_pkg = line.decode().strip().partition('/')
+
+				if getattr(repositories, target_repo, False):
+					# The constraint was on the file (such as a soname), not on the package providing it
+					return [(package_from_pkg, None)]
+
+			raise PackageError(f"Could not locate dependency {package} in an enabled repository")
 
-				if found_fildep:
+		except SysCallError:
+			# Fallback, use `pacman -Ss` in an attempt to resolve the package.
+			# Lines look like: core/bash 5.2.015-1 [installed], followed by an indented description
+			for line in SysCommand(f"pacman --color never -Ss {package}"):
+				if line[:1].isspace():
 					continue
 
-				raise PackageError(f"Could not locate dependency {package} using pkgfile!")
-
-		version = VersionDef(package_info.pkgver)
-		if target_version:
-			target_version = VersionDef(target_version)
-			if target_version_gt and version < target_version:
-				raise PackageError(f"Package {package} requires version newer than {target_version} but {version} was found")
-			elif target_version_gt_or_eq and version < target_version and version != target_version:
-				raise PackageError(f"Package {package} requires version newer or equal to {target_version} but {version} was found")
-			elif target_version_lt and version > target_version:
-				raise PackageError(f"Package {package} requires version older than {target_version} but {version} was found")
-			elif target_version_lt_or_eq and version > target_version and version != target_version:
-				raise PackageError(f"Package {package} requires version older or equal to {target_version} but {version} was found")
-			elif target_version_specific and version != target_version_specific:
-				raise PackageError(f"Package {package} requires version equal to {target_version} but {version} was found")
-
-		repo = package_info.repo
-		database_path = path/repo/"os"/storage['arguments'].architecture
-		if (database_path/package_info.filename).exists:
-			log(f"Package already in cache, skipping", level=logging.INFO)
-
-		if getattr(storage['arguments'], repo) is False:
-			raise PackageError(f"Repository --{repo} is not activated, package is blocked")
-
-		log(f"Found package '{package}', version {version} in repo {repo}", level=logging.DEBUG)
-
-		if not repo in repositories_to_update:
-			repositories_to_update.append(repo)
-
-		grabbed = False
-		for mirror in storage['mirrors']:
-			if not '$package' in mirror:
-				mirror += '/$package'
-
-			mirror_py_friendly = mirror.replace('$repo', repo)
-			mirror_py_friendly = mirror_py_friendly.replace('$arch', storage['arguments'].architecture)
-			mirror_py_friendly = mirror_py_friendly.replace('$package', package_info.filename)
-
-			log(f"Attempting download from mirror {mirror}", level=logging.DEBUG)
-			log(f"Mirror definition was converted to: {mirror_py_friendly}", level=logging.DEBUG)
-			if download_package(package, repo, mirror_py_friendly, database_path, package_info.filename, include_signature=storage['arguments'].skip_sig is False):
-				grabbed = True
-				break
-		
-		if not grabbed:
-			raise PackageError(f"Implement pacman -Syw --cachedir --dbdir ...")
-
-		skip.append(package)
-		if package_info.depends:
-			repositories_to_update = list(set(repositories_to_update + sync_packages(package_info.depends, path, skip)))
-
-	return repositories_to_update
+				target_repo, _, package_from_pacman = line.partition(b' ')[0].decode().partition('/')
+
+				if getattr(repositories, target_repo, False):
+					return [(package_from_pacman, None)]
+
+			raise PackageError(f"Could not locate dependency {package} using pkgfile!")
+
+	version = package_info.version
+	if constraint:
+		op, bound = constraint
+		if not _CONSTRAINT_OPERATORS[op](vercmp(version, bound), 0):
+			raise PackageError(f"Package {package} requires version {op} {bound} but {version} was found")
+
+	repo = package_info.repo
+	database_path = state.path/repo/"os"/storage['arguments'].architecture
+	if repo not in repositories.enabled():
+		raise PackageError(f"Repository --{repo} is not activated, package is blocked")
+
+	log(f"Found package '{package}', version {version} in repo {repo}", level=logging.DEBUG)
+
+	with state.lock:
+		state.repositories_to_update.add(repo)
+
+		if package_info.filename in _directory_listing(database_path):
+			# The dependencies might still be missing, so those are resolved regardless
+			log(f"Package {package_info.filename} already in cache, skipping download", level=logging.INFO)
+		else:
+			# Downloads run in the background while we carry on resolving dependencies
+			state.downloads.append(state.executor.submit(download_from_mirrors, package, package_info, database_path))
+
+	return _parse_dependencies(package_info.depends, state.skip)
 
 def update_repo_db(repo :str, path :pathlib.Path) -> bool:
 	log(f"Updating repo {repo} with any new packages", level=logging.INFO)
 	database_path = path/repo/"os"/storage['arguments'].architecture
 	options = ['--new', '--remove', '--prevent-downgrade']
-	if storage['arguments'].key:
-		log(f"Signing the database with key '{storage['arguments'].key}'", level=logging.INFO, fg="yellow")
+	if (key := storage['arguments'].key):
+		log(f"Signing the database with key '{key}'", level=logging.INFO, fg="yellow")
 		options.append(f"--sign")
-		options.append(f"--key {storage['arguments'].key}")
+		options += ["--key", key]
 
-	for package_type in ['.pkg.tar.xz', '.pkg.tar.zst']:
-		for package in glob.glob(f"{database_path}/*{package_type}"):
-			try:
-				SysCommand(f"repo-add {' '.join(options)} {database_path}/{repo}.db.tar.gz {package}")
-			except SysCallError as error:
-				raise RepositoryError(f"Could not initiate repository {database_path}: [{error.exit_code}] {error}")
+	# One pass over the directory for every compression type, signatures and unfinished downloads excluded
+	packages = [str(package) for package in database_path.glob('*.pkg.tar.*') if package.suffix not in ('.sig', '.part')]
+	if not packages:
+		return True
+
+	# repo-add takes any number of packages, so one call loads and writes the database once
+	try:
+		SysCommand(["repo-add", *options, f"{database_path}/{repo}.db.tar.gz", *packages])
+	except SysCallError as error:
+		raise RepositoryError(f"Could not initiate repository {database_path}: [{error.exit_code}] {error}")
 
 	return True
\ No newline at end of file
@@ -0,0 +1,104 @@
+from typing import Optional, Tuple
+
+def _is_alpha(char :str) -> bool:
+	return 'a' <= char <= 'z' or 'A' <= char <= 'Z'
+
+def _is_digit(char :str) -> bool:
+	return '0' <= char <= '9'
+
+def rpmvercmp(a :str, b :str) -> int:
+	"""
+	A port of libalpm's rpmvercmp(), compares two version segments
+	such as ``1.2.3a`` and ``1.10`` and returns -1, 0 or 1.
+	"""
+	if a == b:
+		return 0
+
+	one, two = 0, 0
+	while one < len(a) and two < len(b):
+		separator_one, separator_two = one, two
+		while one < len(a) and not (_is_alpha(a[one]) or _is_digit(a[one])):
+			one += 1
+		while two < len(b) and not (_is_alpha(b[two]) or _is_digit(b[two])):
+			two += 1
+
+		if one >= len(a) or two >= len(b):
+			break
+
+		# Different separator lengths means we're finished, 1.2 vs 1..2
+		if (one - separator_one) != (two - separator_two):
+			return -1 if (one - separator_one) < (two - separator_two) else 1
+
+		# Grab the next completely numeric or completely alphabetic segment
+		is_number = _is_digit(a[one])
+		is_part = _is_digit if is_number else _is_alpha
+		end_one, end_two = one, two
+		while end_one < len(a) and is_part(a[end_one]):
+			end_one += 1
+		while end_two < len(b) and is_part(b[end_two]):
+			end_two += 1
+
+		segment_one, segment_two = a[one:end_one], b[two:end_two]
+		if not segment_two:
+			# Numeric segments are always newer than alphabetic ones
+			return 1 if is_number else -1
+
+		if is_number:
+			segment_one, segment_two = segment_one.lstrip('0'), segment_two.lstrip('0')
+			# The longer number (without leading zeros) is the larger one
+			if len(segment_one) != len(segment_two):
+				return 1 if len(segment_one) > len(segment_two) else -1
+
+		if segment_one != segment_two:
+			return 1 if segment_one > segment_two else -1
+
+		one, two = end_one, end_two
+
+	if one >= len(a) and two >= len(b):
+		return 0
+
+	# 1.0 < 1.0.1 but 1.0alpha < 1.0
+	if (one >= len(a) and not _is_alpha(b[two])) or (one < len(a) and _is_alpha(a[one])):
+		return -1
+	return 1
+
+def _parse_evr(version :str) -> Tuple[str, str, Optional[str]]:
+	"""
+	Splits ``[epoch:]version[-release]`` into its parts, the epoch defaults to 0.
+	"""
+	epoch, separator, remainder = version.partition(':')
+	if not separator or (epoch and not epoch.isdigit()):
+		epoch, remainder = '0', version
+	elif not epoch:
+		epoch = '0'
+
+	remainder, separator, release = remainder.rpartition('-')
+	if not separator:
+		return epoch, release, None
+
+	return epoch, remainder, release
+
+def _vercmp(a :str, b :str) -> int:
+	"""
+	A port of libalpm's alpm_pkg_vercmp(), compares two full package versions
+	and returns a negative number if ``a`` is older than ``b``, 0 if equal and positive if newer.
+	The release is only compared if both versions have one, just like pacman.
+	"""
+	if a == b:
+		return 0
+
+	epoch_a, version_a, release_a = _parse_evr(a)
+	epoch_b, version_b, release_b = _parse_evr(b)
+
+	if (result := rpmvercmp(epoch_a, epoch_b)) == 0:
+		if (result := rpmvercmp(version_a, version_b)) == 0 and release_a and release_b:
+			result = rpmvercmp(release_a, release_b)
+
+	return result
+
+
+try:
+	# Prefer the C implementation that pacman itself uses
+	from pyalpm import vercmp
+except ModuleNotFoundError:
+	vercmp = _vercmp
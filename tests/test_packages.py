@@ -0,0 +1,45 @@
+import concurrent.futures
+import pathlib
+import sys
+import tempfile
+
+import pytest
+
+# Importing myrepo parses sys.argv and reads the package and mirror lists,
+# so point those at files that exist before importing it.
+_root = pathlib.Path(__file__).parent.parent
+_mirror_list = tempfile.NamedTemporaryFile(prefix='mirrorlist-')
+sys.argv = [sys.argv[0], '--packages', str(_root/'packages.txt.example'), '--mirror-list', _mirror_list.name]
+
+from myrepo.exceptions import PackageError
+from myrepo.tooling import packages
+
+def test_parse_soname_dependency() -> None:
+	assert packages._parse_dependencies(['libaudit.so=1-64', 'glibc>=2.34', 'pam'], set()) == [
+		('libaudit.so', ('=', '1-64')),
+		('glibc', ('>=', '2.34')),
+		('pam', None)
+	]
+
+def test_parse_dependencies_skips_handled_packages() -> None:
+	assert packages._parse_dependencies(['glibc>=2.34', 'pam', 'audit'], {'glibc', 'pam'}) == [('audit', None)]
+
+def test_soname_dependency_resolved_through_pkgfile_drops_constraint(monkeypatch :pytest.MonkeyPatch) -> None:
+	def find_package(package :str) -> None:
+		raise PackageError(f"Could not locate {package}")
+
+	commands = []
+	def sys_command(command :str) -> list:
+		commands.append(command)
+		return [b'core/audit\n']
+
+	monkeypatch.setattr(packages, 'find_package', find_package)
+	monkeypatch.setattr(packages, 'SysCommand', sys_command)
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+		state = packages._SyncState(path=pathlib.Path('/nonexistent'), executor=executor)
+		# The "=1-64" is the soname version, it must not be applied to the audit package
+		assert packages._sync_package('libaudit.so', ('=', '1-64'), state) == [('audit', None)]
+
+	assert commands == ['pkgfile libaudit.so']
+	assert state.skip == {'libaudit.so'}
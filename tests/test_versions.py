@@ -0,0 +1,77 @@
+import importlib.util
+import pathlib
+
+import pytest
+
+# Importing the myrepo package parses sys.argv and reads the package list,
+# so the (dependency free) versions module is loaded on its own.
+_spec = importlib.util.spec_from_file_location("versions", pathlib.Path(__file__).parent.parent/"myrepo"/"tooling"/"versions.py")
+versions = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(versions)
+
+def _sign(value :int) -> int:
+	return (value > 0) - (value < 0)
+
+@pytest.mark.parametrize("a, b, expected", [
+	# Plain numeric segments
+	("1.0", "1.0", 0),
+	("1.0", "2.0", -1),
+	("2.0", "1.0", 1),
+	("9", "10", -1),
+	("1.001", "1.1", 0),
+	("1.0", "1.0.1", -1),
+	("1.0.1", "1.0", 1),
+	("2.40", "2.39.1", 1),
+	# Alpha segments
+	("1.0a", "1.0", -1),
+	("1.0", "1.0a", 1),
+	("1.0rc1", "1.0", -1),
+	("1.0alpha", "1.0beta", -1),
+	("1.0a", "1.0b", -1),
+	("1.0.a", "1.0.1", -1),
+	("a", "1", -1),
+	("1", "a", 1),
+	("1.2.3_p1", "1.2.3", 1),
+	# Differing separators
+	("1..0", "1.0", 1),
+	("1.0", "1..0", -1),
+	("1_0", "1.0", 0),
+	("1+0", "1.0", 0),
+])
+def test_rpmvercmp(a :str, b :str, expected :int) -> None:
+	assert _sign(versions.rpmvercmp(a, b)) == expected
+	assert _sign(versions.rpmvercmp(b, a)) == -expected
+
+@pytest.mark.parametrize("a, b, expected", [
+	# Releases are compared when both sides have one
+	("1.0-1", "1.0-1", 0),
+	("1.0-1", "1.0-2", -1),
+	("1.0-10", "1.0-9", 1),
+	("1.0-1", "1.1-1", -1),
+	("1.1-1", "1.0-5", 1),
+	("1.0-1.1", "1.0-1", 1),
+	# ... and ignored when either side lacks one
+	("1.0", "1.0-5", 0),
+	("1.0-5", "1.0", 0),
+	("1.1", "1.0-5", 1),
+	# Epochs
+	("1:1.0", "2.0", 1),
+	("0:1.0", "1.0", 0),
+	(":1.0", "0:1.0", 0),
+	("1:1.0-1", "1:1.0-2", -1),
+	("2:0.1", "1:9.9", 1),
+	("1:1.0", "1:1.0", 0),
+])
+def test_vercmp(a :str, b :str, expected :int) -> None:
+	assert _sign(versions._vercmp(a, b)) == expected
+	assert _sign(versions._vercmp(b, a)) == -expected
+
+@pytest.mark.parametrize("version, expected", [
+	("1.0", ("0", "1.0", None)),
+	("1.0-2", ("0", "1.0", "2")),
+	("3:1.0-2", ("3", "1.0", "2")),
+	(":1.0", ("0", "1.0", None)),
+	("1.0-rc-2", ("0", "1.0-rc", "2")),
+])
+def test_parse_evr(version :str, expected :tuple) -> None:
+	assert versions._parse_evr(version) == expected